@@ -8,11 +8,44 @@ import json
 from datetime import datetime, timedelta
 import boto3
 
+# orjson is much faster at encoding the larger analytics payloads; fall back
+# to the standard library when it is not installed
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _dumps = json.dumps
+
+DB_PATH = '/tmp/road_metrics.db'
+
+# Shared connection, reused across warm invocations
+_CONN = None
+
+# Count queries for the incrementally refreshed metrics. Each yields
+# (key, count) pairs for the defects matching the formatted WHERE clause,
+# so the same query serves both new rows and rows being cleaned up.
+_INCREMENTAL_METRICS = {
+    'total_defects': "SELECT 'total', COUNT(*) FROM defects WHERE {}",
+    'defects_by_type': 'SELECT defect_type, COUNT(*) FROM defects WHERE {} GROUP BY defect_type',
+    'defects_by_severity': 'SELECT severity, COUNT(*) FROM defects WHERE {} GROUP BY severity',
+    'geographic_distribution': '''
+        SELECT ROUND(latitude, 2) || ',' || ROUND(longitude, 2), COUNT(*)
+        FROM defects
+        WHERE {}
+        GROUP BY ROUND(latitude, 2), ROUND(longitude, 2)
+    '''
+}
+
 def lambda_handler(event, context):
     """
     Batch processor for periodic data aggregation and maintenance
     """
     try:
+        # All tasks share one connection and are committed together at the end
+        conn = get_db_connection()
+        
         results = {
             'processed_at': datetime.now().isoformat(),
             'tasks_completed': []
@@ -38,12 +71,15 @@ def lambda_handler(event, context):
         generate_reports()
         results['tasks_completed'].append('reports_generated')
         
+        conn.commit()
+        
         return {
             'statusCode': 200,
             'body': json.dumps(results)
         }
         
     except Exception as e:
+        _rollback()
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -54,81 +90,122 @@ def lambda_handler(event, context):
 
 def update_analytics_cache():
     """Update cached analytics data"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = get_db_connection().cursor()
     
     # Clear old analytics
     cursor.execute('DELETE FROM analytics WHERE calculated_at < ?', 
                   ((datetime.now() - timedelta(hours=1)).isoformat(),))
     
-    # Recalculate analytics
+    # Only defects added since the last refresh are scanned; their counts are
+    # merged into the state kept in analytics_meta
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM defects')
+    new_max_id = cursor.fetchone()[0]
+    
+    counts = {}
+    for metric_name, query in _INCREMENTAL_METRICS.items():
+        last_id, metric_counts = _load_metric_state(cursor, metric_name)
+        cursor.execute(query.format('id > ? AND id <= ?'), (last_id, new_max_id))
+        for key, count in cursor.fetchall():
+            metric_counts[key] = metric_counts.get(key, 0) + count
+        _save_metric_state(cursor, metric_name, new_max_id, metric_counts)
+        counts[metric_name] = metric_counts
+    
     analytics_data = []
     
     # Total defects
-    cursor.execute('SELECT COUNT(*) FROM defects')
-    total_defects = cursor.fetchone()[0]
+    total_defects = counts['total_defects'].get('total', 0)
     analytics_data.append(('total_defects', str(total_defects)))
     
     # Defects by type
-    cursor.execute('SELECT defect_type, COUNT(*) FROM defects GROUP BY defect_type')
-    type_counts = dict(cursor.fetchall())
-    analytics_data.append(('defects_by_type', json.dumps(type_counts)))
+    analytics_data.append(('defects_by_type', _dumps(counts['defects_by_type'])))
     
     # Defects by severity
-    cursor.execute('SELECT severity, COUNT(*) FROM defects GROUP BY severity')
-    severity_counts = dict(cursor.fetchall())
-    analytics_data.append(('defects_by_severity', json.dumps(severity_counts)))
+    analytics_data.append(('defects_by_severity', _dumps(counts['defects_by_severity'])))
     
-    # Geographic distribution
+    # Recent activity (last 7 days)
+    week_ago = (datetime.now() - timedelta(days=7)).isoformat()
+    cursor.execute('SELECT COUNT(*) FROM defects WHERE timestamp >= ?', (week_ago,))
+    recent_count = cursor.fetchone()[0]
+    analytics_data.append(('recent_defects_7d', str(recent_count)))
+    
+    # Top reporting vehicles
     cursor.execute('''
-        SELECT 
-            ROUND(latitude, 2) as lat_zone,
-            ROUND(longitude, 2) as lng_zone,
-            COUNT(*) as defect_count
-        FROM defects 
-        GROUP BY lat_zone, lng_zone
-        HAVING defect_count > 0
-        ORDER BY defect_count DESC
+        SELECT vehicle_id, total_reports 
+        FROM vehicles 
+        ORDER BY total_reports DESC 
+        LIMIT 5
     ''')
-    geo_data = [{'lat': row[0], 'lng': row[1], 'count': row[2]} for row in cursor.fetchall()]
-    analytics_data.append(('geographic_distribution', json.dumps(geo_data)))
+    top_vehicles = [{'vehicleId': row[0], 'reports': row[1]} for row in cursor.fetchall()]
+    analytics_data.append(('top_vehicles', _dumps(top_vehicles)))
+    
+    # Geographic distribution
+    geo_data = []
+    for zone, count in sorted(counts['geographic_distribution'].items(),
+                              key=lambda item: item[1], reverse=True):
+        lat_zone, lng_zone = zone.split(',')
+        geo_data.append({'lat': float(lat_zone), 'lng': float(lng_zone), 'count': count})
+    analytics_data.append(('geographic_distribution', _dumps(geo_data)))
     
     # Insert new analytics
     cursor.executemany('''
         INSERT INTO analytics (metric_name, metric_value)
         VALUES (?, ?)
     ''', analytics_data)
-    
-    conn.commit()
-    conn.close()
+
+def _load_metric_state(cursor, metric_name):
+    """Get the last processed defect id and stored counts for a metric"""
+    cursor.execute('SELECT last_id, payload FROM analytics_meta WHERE metric_name = ?',
+                   (metric_name,))
+    row = cursor.fetchone()
+    if row is None:
+        return 0, {}
+    return row[0], json.loads(row[1])
+
+def _save_metric_state(cursor, metric_name, last_id, metric_counts):
+    """Store the last processed defect id and merged counts for a metric"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO analytics_meta (metric_name, last_id, payload)
+        VALUES (?, ?, ?)
+    ''', (metric_name, last_id, _dumps(metric_counts)))
 
 def cleanup_old_data():
     """Clean up data older than 2 years"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = get_db_connection().cursor()
     
     two_years_ago = (datetime.now() - timedelta(days=730)).isoformat()
     
+    # Take already-counted rows back out of the incremental analytics state
+    for metric_name, query in _INCREMENTAL_METRICS.items():
+        last_id, metric_counts = _load_metric_state(cursor, metric_name)
+        cursor.execute(query.format('timestamp < ? AND id <= ?'), (two_years_ago, last_id))
+        for key, count in cursor.fetchall():
+            remaining = metric_counts.get(key, 0) - count
+            if remaining > 0:
+                metric_counts[key] = remaining
+            else:
+                metric_counts.pop(key, None)
+        _save_metric_state(cursor, metric_name, last_id, metric_counts)
+    
     cursor.execute('DELETE FROM defects WHERE timestamp < ?', (two_years_ago,))
     cleaned_count = cursor.rowcount
     
-    conn.commit()
-    conn.close()
-    
     return cleaned_count
 
 def generate_heatmap_data():
     """Generate optimized heatmap data for frontend"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = get_db_connection().cursor()
     
-    # Generate heatmap points with intensity
+    # Generate heatmap points with intensity weighted by severity
     cursor.execute('''
         SELECT 
             latitude,
             longitude,
-            severity,
-            COUNT(*) as intensity
+            COUNT(*) * CASE severity
+                WHEN 'critical' THEN 4
+                WHEN 'high' THEN 3
+                WHEN 'medium' THEN 2
+                ELSE 1
+            END as intensity
         FROM defects 
         WHERE timestamp >= ?
         GROUP BY 
@@ -137,100 +214,119 @@ def generate_heatmap_data():
             severity
     ''', ((datetime.now() - timedelta(days=30)).isoformat(),))
     
-    heatmap_data = []
-    for row in cursor.fetchall():
-        weight = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}.get(row[2], 1)
-        heatmap_data.append({
-            'lat': row[0],
-            'lng': row[1],
-            'intensity': row[3] * weight
-        })
+    heatmap_data = [
+        {'lat': lat, 'lng': lng, 'intensity': intensity}
+        for lat, lng, intensity in cursor.fetchall()
+    ]
     
     # Store heatmap data
     cursor.execute('''
         INSERT OR REPLACE INTO analytics (metric_name, metric_value)
         VALUES ('heatmap_data', ?)
-    ''', (json.dumps(heatmap_data),))
-    
-    conn.commit()
-    conn.close()
+    ''', (_dumps(heatmap_data),))
 
 def update_vehicle_stats():
     """Update vehicle reporting statistics"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = get_db_connection().cursor()
     
-    # Update vehicle statistics
+    # Recount every vehicle in one grouped scan over defects, then update the
+    # vehicles in place (no ON CONFLICT DO UPDATE, which needs SQLite 3.24+)
     cursor.execute('''
-        UPDATE vehicles 
-        SET total_reports = (
-            SELECT COUNT(*) 
-            FROM defects 
-            WHERE defects.vehicle_id = vehicles.vehicle_id
-        ),
-        last_report_timestamp = (
-            SELECT MAX(timestamp) 
-            FROM defects 
-            WHERE defects.vehicle_id = vehicles.vehicle_id
-        )
+        SELECT vehicle_id, COUNT(*), MAX(timestamp)
+        FROM defects
+        WHERE vehicle_id IS NOT NULL
+        GROUP BY vehicle_id
     ''')
+    vehicle_counts = cursor.fetchall()
+    cursor.executemany('''
+        INSERT OR IGNORE INTO vehicles (vehicle_id) VALUES (?)
+    ''', [(vehicle_id,) for vehicle_id, _, _ in vehicle_counts])
+    cursor.executemany('''
+        UPDATE vehicles
+        SET total_reports = ?,
+            last_report_timestamp = ?
+        WHERE vehicle_id = ?
+    ''', [(count, last_timestamp, vehicle_id)
+          for vehicle_id, count, last_timestamp in vehicle_counts])
     
-    conn.commit()
-    conn.close()
+    # Reset vehicles whose defects have all been cleaned up
+    cursor.execute('''
+        UPDATE vehicles
+        SET total_reports = 0,
+            last_report_timestamp = NULL
+        WHERE vehicle_id NOT IN (
+            SELECT vehicle_id FROM defects WHERE vehicle_id IS NOT NULL
+        )
+    ''')
 
 def generate_reports():
     """Generate daily and weekly summary reports"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = get_db_connection().cursor()
     
-    # Daily report
+    # One scan over the last week feeds both reports
     today = datetime.now().date()
+    week_ago = today - timedelta(days=7)
     cursor.execute('''
         SELECT 
+            substr(timestamp, 1, 10) as report_date,
             defect_type,
             severity,
             COUNT(*) as count
         FROM defects 
-        WHERE DATE(timestamp) = ?
-        GROUP BY defect_type, severity
-    ''', (today.isoformat(),))
+        WHERE timestamp >= ?
+        GROUP BY report_date, defect_type, severity
+        ORDER BY report_date, defect_type, severity
+    ''', (week_ago.isoformat(),))
     
-    daily_data = cursor.fetchall()
+    daily_summary = []
+    daily_counts = {}
+    for report_date, defect_type, severity, count in cursor.fetchall():
+        daily_counts[report_date] = daily_counts.get(report_date, 0) + count
+        if report_date == today.isoformat():
+            daily_summary.append({'type': defect_type, 'severity': severity, 'count': count})
+    
+    # Daily report
     daily_report = {
         'date': today.isoformat(),
-        'summary': [{'type': row[0], 'severity': row[1], 'count': row[2]} for row in daily_data]
+        'summary': daily_summary
     }
     
     # Weekly report
-    week_ago = today - timedelta(days=7)
-    cursor.execute('''
-        SELECT 
-            DATE(timestamp) as report_date,
-            COUNT(*) as daily_count
-        FROM defects 
-        WHERE DATE(timestamp) >= ?
-        GROUP BY DATE(timestamp)
-        ORDER BY report_date
-    ''', (week_ago.isoformat(),))
-    
-    weekly_data = cursor.fetchall()
     weekly_report = {
         'week_ending': today.isoformat(),
-        'daily_counts': [{'date': row[0], 'count': row[1]} for row in weekly_data]
+        'daily_counts': [{'date': date, 'count': count} for date, count in daily_counts.items()]
     }
     
     # Store reports
-    cursor.execute('''
+    cursor.executemany('''
         INSERT INTO analytics (metric_name, metric_value)
-        VALUES ('daily_report', ?), ('weekly_report', ?)
-    ''', (json.dumps(daily_report), json.dumps(weekly_report)))
-    
-    conn.commit()
-    conn.close()
+        VALUES (?, ?)
+    ''', [
+        ('daily_report', _dumps(daily_report)),
+        ('weekly_report', _dumps(weekly_report))
+    ])
+
+def _apply_pragmas(conn):
+    """Tune SQLite for write-heavy workloads"""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.execute('PRAGMA busy_timeout=5000')
 
 def get_db_connection():
     """Get database connection"""
-    return sqlite3.connect('/tmp/road_metrics.db')
+    global _CONN
+    if _CONN is None:
+        _CONN = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _apply_pragmas(_CONN)
+    return _CONN
+
+def _rollback():
+    """Discard any transaction left open on the shared connection"""
+    if _CONN is not None:
+        _CONN.rollback()
 
 if __name__ == "__main__":
     # For local testing
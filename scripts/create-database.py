@@ -13,66 +13,109 @@ def create_database():
     conn = sqlite3.connect('road_metrics.db')
     cursor = conn.cursor()
     
-    # Create defects table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS defects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            latitude REAL NOT NULL,
-            longitude REAL NOT NULL,
-            defect_type VARCHAR(50) NOT NULL,
-            severity VARCHAR(20) NOT NULL CHECK (severity IN ('low', 'medium', 'high', 'critical')),
-            notes TEXT,
-            vehicle_id VARCHAR(50),
-            timestamp DATETIME NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Page size must be set before the first table is created; larger pages
+    # keep the JSON analytics values out of overflow chains
+    cursor.execute('PRAGMA page_size=8192')
+    cursor.execute('PRAGMA journal_mode=WAL')
     
-    # Create index for better query performance
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_defects_location 
-        ON defects (latitude, longitude)
-    ''')
+    # Create the whole schema in one transaction (one commit instead of one
+    # per statement)
+    with conn:
+        cursor.execute('BEGIN')
+        
+        # Create defects table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS defects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                defect_type VARCHAR(50) NOT NULL,
+                severity VARCHAR(20) NOT NULL
+                    CHECK (severity IN ('low', 'medium', 'high', 'critical')),
+                notes TEXT,
+                vehicle_id VARCHAR(50),
+                timestamp DATETIME NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Create index for better query performance
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_defects_location 
+            ON defects (latitude, longitude)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_defects_timestamp 
+            ON defects (timestamp)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_defects_severity 
+            ON defects (severity)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_defects_vehicle_id 
+            ON defects (vehicle_id)
+        ''')
+        
+        # Covers time-range filters grouped by type/severity (reports, heatmap)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_defects_ts_type_sev 
+            ON defects (timestamp, defect_type, severity)
+        ''')
+        
+        # Covers type/severity grouping
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_defects_type_sev 
+            ON defects (defect_type, severity)
+        ''')
+        
+        # Create analytics table for aggregated data
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analytics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                metric_name VARCHAR(100) NOT NULL,
+                metric_value TEXT NOT NULL,
+                calculated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Latest-value lookups by metric name (analytics endpoint, cached total)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_analytics_name_time 
+            ON analytics (metric_name, calculated_at)
+        ''')
+        
+        # Create analytics_meta table for incremental analytics refresh state
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analytics_meta (
+                metric_name VARCHAR(100) PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL
+            )
+        ''')
+        
+        # Create vehicles table for tracking reporting vehicles
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vehicles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                vehicle_id VARCHAR(50) UNIQUE NOT NULL,
+                last_report_timestamp DATETIME,
+                total_reports INTEGER DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
     
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_defects_timestamp 
-        ON defects (timestamp)
-    ''')
-    
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_defects_severity 
-        ON defects (severity)
-    ''')
-    
-    # Create analytics table for aggregated data
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS analytics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            metric_name VARCHAR(100) NOT NULL,
-            metric_value TEXT NOT NULL,
-            calculated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create vehicles table for tracking reporting vehicles
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vehicles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            vehicle_id VARCHAR(50) UNIQUE NOT NULL,
-            last_report_timestamp DATETIME,
-            total_reports INTEGER DEFAULT 0,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
     conn.close()
     
     print("Database and tables created successfully!")
     print("Tables created:")
     print("- defects: Main table for storing road defect reports")
     print("- analytics: Table for storing calculated metrics")
+    print("- analytics_meta: Table for incremental analytics refresh state")
     print("- vehicles: Table for tracking reporting vehicles")
 
 if __name__ == "__main__":
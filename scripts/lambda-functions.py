@@ -4,17 +4,133 @@ These would be deployed as separate Lambda functions
 """
 
 import json
+import math
 import sqlite3
 import boto3
 from datetime import datetime
 import os
 
+# Use orjson for response bodies when it is available (e.g. via a Lambda layer)
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _dumps = json.dumps
+
+DB_PATH = '/tmp/road_metrics.db'
+
+# Shared connection, reused across warm Lambda invocations
+_CONN = None
+
+# Shared by every API response
+_CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+# SQL shared by the handlers; the get_defects query for each filter combination
+# is built once below instead of being concatenated on every request
+SQL_INSERT_DEFECT = '''
+    INSERT INTO defects (latitude, longitude, defect_type, severity, notes, vehicle_id, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Vehicle totals are updated in place with INSERT OR IGNORE + UPDATE rather
+# than ON CONFLICT DO UPDATE, which needs SQLite 3.24+
+SQL_INSERT_VEHICLE = '''
+    INSERT OR IGNORE INTO vehicles (vehicle_id, total_reports)
+    VALUES (?, 0)
+'''
+
+SQL_ADD_VEHICLE_REPORTS = '''
+    UPDATE vehicles
+    SET total_reports = total_reports + :inc,
+        last_report_timestamp = MAX(COALESCE(last_report_timestamp, ''), :ts)
+    WHERE vehicle_id = :vid
+'''
+
+SQL_SELECT_DEFECTS_BASE = '''
+    SELECT id, latitude, longitude, defect_type, severity, 
+           notes, vehicle_id, timestamp, created_at
+    FROM defects
+'''
+
+SQL_COUNT_DEFECTS_BASE = 'SELECT COUNT(*) FROM defects'
+
+# WHERE clauses keyed by (has severity filter, has type filter)
+_DEFECT_FILTERS = {
+    (False, False): '',
+    (True, False): ' WHERE severity = ?',
+    (False, True): ' WHERE defect_type = ?',
+    (True, True): ' WHERE severity = ? AND defect_type = ?'
+}
+
+SQL_SELECT_DEFECTS = {
+    key: SQL_SELECT_DEFECTS_BASE + where + ' ORDER BY timestamp DESC LIMIT ? OFFSET ?'
+    for key, where in _DEFECT_FILTERS.items()
+}
+
+SQL_COUNT_DEFECTS = {
+    key: SQL_COUNT_DEFECTS_BASE + where
+    for key, where in _DEFECT_FILTERS.items()
+}
+
+SQL_SELECT_CACHED_TOTAL = '''
+    SELECT metric_value
+    FROM analytics
+    WHERE metric_name = 'total_defects'
+    ORDER BY calculated_at DESC, id DESC
+    LIMIT 1
+'''
+
+SQL_SELECT_ANALYTICS = '''
+    SELECT metric_name, metric_value
+    FROM analytics
+    WHERE metric_name IN ('total_defects', 'defects_by_type', 'defects_by_severity',
+                          'recent_defects_7d', 'top_vehicles')
+    ORDER BY calculated_at, id
+'''
+
+def _apply_pragmas(conn):
+    """Tune SQLite for write-heavy workloads"""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.execute('PRAGMA busy_timeout=5000')
+
 # Database connection helper
 def get_db_connection():
     """Get database connection - in production this would use RDS"""
     # In AWS Lambda, you'd use RDS connection
     # For demo purposes, using SQLite
-    return sqlite3.connect('/tmp/road_metrics.db')
+    global _CONN
+    if _CONN is None:
+        _CONN = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        _apply_pragmas(_CONN)
+    return _CONN
+
+def _rollback():
+    """Discard any transaction left open on the shared connection"""
+    if _CONN is not None:
+        _CONN.rollback()
+
+def _is_number(value):
+    """Check for a JSON number (bool is an int subclass but not a number here)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _resp(status_code, body):
+    """Build an API Gateway response with the shared CORS headers"""
+    return {
+        'statusCode': status_code,
+        'headers': _CORS_HEADERS,
+        'body': _dumps(body)
+    }
 
 def lambda_handler_get_defects(event, context):
     """
@@ -31,77 +147,56 @@ def lambda_handler_get_defects(event, context):
         offset = int(query_params.get('offset', 0))
         severity_filter = query_params.get('severity')
         type_filter = query_params.get('type')
+        include_total = query_params.get('include_total') == '1'
+        
+        # Pick the prepared query for this filter combination
+        filter_key = (bool(severity_filter), bool(type_filter))
+        params = [value for value in (severity_filter, type_filter) if value]
+        
+        # Total matching rows, not just the size of this page. Unfiltered
+        # requests use the total materialized by the batch processor; filtered
+        # ones only pay for a COUNT(*) when the client asks for it.
+        total = None
+        if not params:
+            cursor.execute(SQL_SELECT_CACHED_TOTAL)
+            row = cursor.fetchone()
+            if row is not None:
+                total = int(row[0])
+        if total is None and (not params or include_total):
+            cursor.execute(SQL_COUNT_DEFECTS[filter_key], params)
+            total = cursor.fetchone()[0]
+        
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(SQL_SELECT_DEFECTS[filter_key], params + [limit, offset])
+        
+        # Convert to JSON format straight from the cursor, without an
+        # intermediate fetchall() list
+        defects = [
+            {
+                'id': str(row['id']),
+                'coordinates': [row['longitude'], row['latitude']],  # [lng, lat] for frontend
+                'defectType': row['defect_type'],
+                'severity': row['severity'],
+                'notes': row['notes'],
+                'vehicleId': row['vehicle_id'],
+                'timestamp': row['timestamp'],
+                'createdAt': row['created_at']
+            }
+            for row in cursor
+        ]
         
-        # Build query
-        query = '''
-            SELECT id, latitude, longitude, defect_type, severity, 
-                   notes, vehicle_id, timestamp, created_at
-            FROM defects
-        '''
-        params = []
-        conditions = []
-        
-        if severity_filter:
-            conditions.append('severity = ?')
-            params.append(severity_filter)
-        
-        if type_filter:
-            conditions.append('defect_type = ?')
-            params.append(type_filter)
-        
-        if conditions:
-            query += ' WHERE ' + ' AND '.join(conditions)
-        
-        query += ' ORDER BY timestamp DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
-        
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
-        # Convert to JSON format
-        defects = []
-        for row in rows:
-            defects.append({
-                'id': str(row[0]),
-                'coordinates': [row[2], row[1]],  # [lng, lat] for frontend
-                'defectType': row[3],
-                'severity': row[4],
-                'notes': row[5],
-                'vehicleId': row[6],
-                'timestamp': row[7],
-                'createdAt': row[8]
-            })
-        
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': json.dumps({
-                'defects': defects,
-                'total': len(defects),
-                'limit': limit,
-                'offset': offset
-            })
-        }
+        return _resp(200, {
+            'defects': defects,
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        })
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
+        return _resp(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
 
 def lambda_handler_create_defect(event, context):
     """
@@ -116,41 +211,24 @@ def lambda_handler_create_defect(event, context):
         required_fields = ['coordinates', 'defectType', 'severity']
         for field in required_fields:
             if field not in body:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'Missing required field',
-                        'field': field
-                    })
-                }
+                return _resp(400, {
+                    'error': 'Missing required field',
+                    'field': field
+                })
         
         # Validate severity
         valid_severities = ['low', 'medium', 'high', 'critical']
         if body['severity'] not in valid_severities:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Invalid severity level',
-                    'validValues': valid_severities
-                })
-            }
+            return _resp(400, {
+                'error': 'Invalid severity level',
+                'validValues': valid_severities
+            })
         
         # Insert into database
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO defects (latitude, longitude, defect_type, severity, notes, vehicle_id, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        cursor.execute(SQL_INSERT_DEFECT, (
             body['coordinates'][1],  # latitude
             body['coordinates'][0],  # longitude
             body['defectType'],
@@ -164,49 +242,28 @@ def lambda_handler_create_defect(event, context):
         
         # Update vehicle tracking if vehicle_id provided
         if body.get('vehicleId'):
-            cursor.execute('''
-                INSERT OR REPLACE INTO vehicles (vehicle_id, last_report_timestamp, total_reports)
-                VALUES (?, ?, COALESCE((SELECT total_reports FROM vehicles WHERE vehicle_id = ?), 0) + 1)
-            ''', (body['vehicleId'], datetime.now().isoformat(), body['vehicleId']))
+            cursor.execute(SQL_INSERT_VEHICLE, (body['vehicleId'],))
+            cursor.execute(SQL_ADD_VEHICLE_REPORTS, {
+                'vid': body['vehicleId'], 'inc': 1, 'ts': datetime.now().isoformat()
+            })
         
         conn.commit()
-        conn.close()
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Defect reported successfully',
-                'defectId': str(defect_id)
-            })
-        }
+        return _resp(201, {
+            'message': 'Defect reported successfully',
+            'defectId': str(defect_id)
+        })
         
     except json.JSONDecodeError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Invalid JSON in request body'
-            })
-        }
+        return _resp(400, {
+            'error': 'Invalid JSON in request body'
+        })
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
+        _rollback()
+        return _resp(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
 
 def lambda_handler_bulk_upload(event, context):
     """
@@ -220,10 +277,9 @@ def lambda_handler_bulk_upload(event, context):
         # Handle both single object and array
         defects_data = body if isinstance(body, list) else [body]
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        inserted_count = 0
+        valid_severities = ['low', 'medium', 'high', 'critical']
+        defect_rows = []
+        vehicle_reports = {}
         errors = []
         
         for i, defect_data in enumerate(defects_data):
@@ -237,62 +293,98 @@ def lambda_handler_bulk_upload(event, context):
                 severity = defect_data.get('severity', 'medium')
                 timestamp = defect_data.get('timestamp', datetime.now().isoformat())
                 
-                cursor.execute('''
-                    INSERT INTO defects (latitude, longitude, defect_type, severity, notes, vehicle_id, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    defect_data['coordinates'][1],  # latitude
-                    defect_data['coordinates'][0],  # longitude
+                # Everything the database would reject is checked here, so one bad
+                # record is reported in errors instead of aborting the batch insert
+                if severity not in valid_severities:
+                    errors.append(f"Record {i}: Invalid severity level")
+                    continue
+                
+                lng, lat = defect_data['coordinates'][0], defect_data['coordinates'][1]
+                if not all(_is_number(value) and math.isfinite(value) for value in (lat, lng)):
+                    errors.append(f"Record {i}: Coordinates must be finite numbers")
+                    continue
+                
+                if not isinstance(defect_data['defectType'], str):
+                    errors.append(f"Record {i}: defectType must be a string")
+                    continue
+                
+                if not isinstance(timestamp, str):
+                    errors.append(f"Record {i}: timestamp must be a string")
+                    continue
+                
+                notes = defect_data.get('notes')
+                vehicle_id = defect_data.get('vehicle_id')
+                if not all(value is None or isinstance(value, str) or _is_number(value)
+                           for value in (notes, vehicle_id)):
+                    errors.append(f"Record {i}: notes and vehicle_id must be strings or numbers")
+                    continue
+                
+                # Only truthy vehicle ids are tracked, as before; decide on the raw
+                # value so 0 is not turned into a tracked vehicle '0'
+                tracked = bool(vehicle_id)
+                
+                # Both are text columns, so store numbers the way SQLite would anyway
+                notes = None if notes is None else str(notes)
+                vehicle_id = None if vehicle_id is None else str(vehicle_id)
+                
+                defect_row = (
+                    float(lat),
+                    float(lng),
                     defect_data['defectType'],
                     severity,
-                    defect_data.get('notes'),
-                    defect_data.get('vehicle_id'),
+                    notes,
+                    vehicle_id,
                     timestamp
-                ))
+                )
                 
-                inserted_count += 1
+                # Aggregate vehicle tracking per vehicle; the new totals are only
+                # stored once both the row and the aggregation have succeeded
+                if tracked:
+                    previous = vehicle_reports.get(vehicle_id)
+                    report = {'count': 1, 'last_timestamp': timestamp}
+                    if previous:
+                        report = {
+                            'count': previous['count'] + 1,
+                            'last_timestamp': max(previous['last_timestamp'], timestamp)
+                        }
                 
-                # Update vehicle tracking
-                if defect_data.get('vehicle_id'):
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO vehicles (vehicle_id, last_report_timestamp, total_reports)
-                        VALUES (?, ?, COALESCE((SELECT total_reports FROM vehicles WHERE vehicle_id = ?), 0) + 1)
-                    ''', (defect_data['vehicle_id'], timestamp, defect_data['vehicle_id']))
+                defect_rows.append(defect_row)
+                if tracked:
+                    vehicle_reports[vehicle_id] = report
                 
             except Exception as e:
                 errors.append(f"Record {i}: {str(e)}")
         
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Single transaction for the whole batch: one commit instead of one per record
+        conn.execute('BEGIN IMMEDIATE')
+        cursor.executemany(SQL_INSERT_DEFECT, defect_rows)
+        
+        # One update per distinct vehicle rather than one per record
+        cursor.executemany(SQL_INSERT_VEHICLE, [(vehicle_id,) for vehicle_id in vehicle_reports])
+        cursor.executemany(SQL_ADD_VEHICLE_REPORTS, [
+            {'vid': vehicle_id, 'inc': data['count'], 'ts': data['last_timestamp']}
+            for vehicle_id, data in vehicle_reports.items()
+        ])
         conn.commit()
-        conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Bulk upload completed',
-                'insertedCount': inserted_count,
-                'totalRecords': len(defects_data),
-                'errors': errors
-            })
-        }
+        inserted_count = len(defect_rows)
+        
+        return _resp(200, {
+            'message': 'Bulk upload completed',
+            'insertedCount': inserted_count,
+            'totalRecords': len(defects_data),
+            'errors': errors
+        })
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
+        _rollback()
+        return _resp(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
 
 def lambda_handler_analytics(event, context):
     """
@@ -303,55 +395,22 @@ def lambda_handler_analytics(event, context):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        analytics = {}
+        # Served from the analytics table materialized by the batch processor
+        cursor.execute(SQL_SELECT_ANALYTICS)
+        metrics = dict(cursor.fetchall())  # latest row wins per metric
         
-        # Total defects
-        cursor.execute('SELECT COUNT(*) FROM defects')
-        analytics['totalDefects'] = cursor.fetchone()[0]
-        
-        # Defects by type
-        cursor.execute('SELECT defect_type, COUNT(*) FROM defects GROUP BY defect_type')
-        analytics['defectsByType'] = dict(cursor.fetchall())
-        
-        # Defects by severity
-        cursor.execute('SELECT severity, COUNT(*) FROM defects GROUP BY severity')
-        analytics['defectsBySeverity'] = dict(cursor.fetchall())
-        
-        # Recent activity (last 7 days)
-        from datetime import timedelta
-        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        cursor.execute('SELECT COUNT(*) FROM defects WHERE timestamp >= ?', (week_ago,))
-        analytics['recentDefects'] = cursor.fetchone()[0]
-        
-        # Top reporting vehicles
-        cursor.execute('''
-            SELECT vehicle_id, total_reports 
-            FROM vehicles 
-            ORDER BY total_reports DESC 
-            LIMIT 5
-        ''')
-        analytics['topVehicles'] = [{'vehicleId': row[0], 'reports': row[1]} for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(analytics)
+        analytics = {
+            'totalDefects': int(metrics.get('total_defects', 0)),
+            'defectsByType': json.loads(metrics.get('defects_by_type', '{}')),
+            'defectsBySeverity': json.loads(metrics.get('defects_by_severity', '{}')),
+            'recentDefects': int(metrics.get('recent_defects_7d', 0)),
+            'topVehicles': json.loads(metrics.get('top_vehicles', '[]'))
         }
         
+        return _resp(200, analytics)
+        
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
+        return _resp(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
@@ -5,7 +5,7 @@ Seed script to populate the database with sample data
 import sqlite3
 import json
 from datetime import datetime, timedelta
-import random
+import numpy as np
 
 def seed_database():
     """Populate database with sample defect data"""
@@ -22,41 +22,56 @@ def seed_database():
     lat_range = (12.8, 13.1)
     lng_range = (77.4, 77.8)
     
-    sample_defects = []
-    
-    # Generate 50 sample defects
-    for i in range(50):
-        # Random location in Bangalore
-        lat = random.uniform(*lat_range)
-        lng = random.uniform(*lng_range)
-        
-        # Random defect type and severity
-        defect_type = random.choice(defect_types)
-        severity = random.choices(severities, weights=severity_weights)[0]
-        
-        # Random timestamp within last 30 days
-        days_ago = random.randint(0, 30)
-        hours_ago = random.randint(0, 23)
-        timestamp = datetime.now() - timedelta(days=days_ago, hours=hours_ago)
-        
-        # Optional vehicle ID (70% chance)
-        vehicle_id = f"V{random.randint(100, 999)}" if random.random() < 0.7 else None
-        
-        # Optional notes (40% chance)
-        notes = None
-        if random.random() < 0.4:
-            note_templates = [
-                f"Large {defect_type} affecting traffic flow",
-                f"Multiple {defect_type}s in this area",
-                f"Urgent repair needed for this {defect_type}",
-                f"Safety hazard - {defect_type} causing vehicle damage",
-                f"Weather-related {defect_type} formation"
-            ]
-            notes = random.choice(note_templates)
-        
-        sample_defects.append((
-            lat, lng, defect_type, severity, notes, vehicle_id, timestamp.isoformat()
-        ))
+    note_templates = [
+        "Large {} affecting traffic flow",
+        "Multiple {}s in this area",
+        "Urgent repair needed for this {}",
+        "Safety hazard - {} causing vehicle damage",
+        "Weather-related {} formation"
+    ]
+    
+    # Generate 50 sample defects, one vectorized draw per column
+    rng = np.random.default_rng()
+    n = 50
+    
+    # Random location in Bangalore
+    lats = rng.uniform(*lat_range, n)
+    lngs = rng.uniform(*lng_range, n)
+    
+    # Random defect type and severity
+    types = rng.choice(defect_types, n)
+    sevs = rng.choice(severities, n, p=severity_weights)
+    
+    # Random timestamp within last 30 days
+    days_ago = rng.integers(0, 31, n)
+    hours_ago = rng.integers(0, 24, n)
+    timestamps = (
+        np.datetime64(datetime.now(), 'us')
+        - days_ago.astype('timedelta64[D]')
+        - hours_ago.astype('timedelta64[h]')
+    )
+    timestamps = np.datetime_as_string(timestamps, unit='us')
+    
+    # Optional vehicle ID (70% chance)
+    has_vehicle = rng.random(n) < 0.7
+    vehicle_ids = np.char.add('V', rng.integers(100, 1000, n).astype(str))
+    vehicle_ids = np.where(has_vehicle, vehicle_ids, None)
+    
+    # Optional notes (40% chance)
+    has_notes = rng.random(n) < 0.4
+    note_choices = rng.integers(0, len(note_templates), n)
+    
+    sample_defects = [
+        (
+            lat, lng, defect_type, severity,
+            note_templates[note].format(defect_type) if with_notes else None,
+            vehicle_id, timestamp
+        )
+        for lat, lng, defect_type, severity, with_notes, note, vehicle_id, timestamp in zip(
+            lats.tolist(), lngs.tolist(), types.tolist(), sevs.tolist(),
+            has_notes.tolist(), note_choices.tolist(), vehicle_ids.tolist(), timestamps.tolist()
+        )
+    ]
     
     # Insert sample data
     cursor.executemany('''
@@ -75,12 +90,17 @@ def seed_database():
             if defect[6] > vehicle_reports[vehicle_id]['last_timestamp']:
                 vehicle_reports[vehicle_id]['last_timestamp'] = defect[6]
     
-    # Insert vehicle data
-    for vehicle_id, data in vehicle_reports.items():
-        cursor.execute('''
-            INSERT OR REPLACE INTO vehicles (vehicle_id, last_report_timestamp, total_reports)
-            VALUES (?, ?, ?)
-        ''', (vehicle_id, data['last_timestamp'], data['count']))
+    # Insert vehicle data, updating existing vehicles in place
+    cursor.executemany('''
+        INSERT OR IGNORE INTO vehicles (vehicle_id) VALUES (?)
+    ''', [(vehicle_id,) for vehicle_id in vehicle_reports])
+    cursor.executemany('''
+        UPDATE vehicles
+        SET total_reports = ?,
+            last_report_timestamp = ?
+        WHERE vehicle_id = ?
+    ''', [(data['count'], data['last_timestamp'], vehicle_id)
+          for vehicle_id, data in vehicle_reports.items()])
     
     # Calculate and store analytics
     analytics_data = []
@@ -106,6 +126,16 @@ def seed_database():
     recent_count = cursor.fetchone()[0]
     analytics_data.append(('recent_defects_7d', str(recent_count)))
     
+    # Top reporting vehicles
+    cursor.execute('''
+        SELECT vehicle_id, total_reports 
+        FROM vehicles 
+        ORDER BY total_reports DESC 
+        LIMIT 5
+    ''')
+    top_vehicles = [{'vehicleId': row[0], 'reports': row[1]} for row in cursor.fetchall()]
+    analytics_data.append(('top_vehicles', json.dumps(top_vehicles)))
+    
     # Insert analytics
     cursor.executemany('''
         INSERT INTO analytics (metric_name, metric_value)
@@ -113,6 +143,9 @@ def seed_database():
     ''', analytics_data)
     
     conn.commit()
+    
+    # Refresh planner statistics now that the tables have data
+    cursor.execute('ANALYZE')
     conn.close()
     
     print(f"Database seeded successfully!")
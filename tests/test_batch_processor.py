@@ -0,0 +1,130 @@
+"""
+Tests for the incremental analytics refresh in the batch processor
+"""
+
+import importlib.util
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'scripts')
+
+
+def load_script(name, filename):
+    """Load a script module whose file name is not importable (contains hyphens)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def batch_processor(tmp_path, monkeypatch):
+    """Batch processor module bound to a fresh database in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    load_script('create_database', 'create-database.py').create_database()
+
+    module = load_script('batch_processor', 'batch-processor.py')
+    module.DB_PATH = str(tmp_path / 'road_metrics.db')
+    yield module
+    if module._CONN is not None:
+        module._CONN.close()
+
+
+def insert_defects(conn, defects):
+    """Insert (latitude, longitude, defect_type, severity, days_ago) rows"""
+    now = datetime.now()
+    conn.executemany('''
+        INSERT INTO defects (latitude, longitude, defect_type, severity, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (lat, lng, defect_type, severity, (now - timedelta(days=days_ago)).isoformat())
+        for lat, lng, defect_type, severity, days_ago in defects
+    ])
+    conn.commit()
+
+
+def stored_counts(conn):
+    """Counts kept in analytics_meta, keyed by metric name"""
+    rows = conn.execute('SELECT metric_name, payload FROM analytics_meta').fetchall()
+    return {metric_name: json.loads(payload) for metric_name, payload in rows}
+
+
+def recomputed_counts(conn):
+    """The same counts computed from scratch over the defects table"""
+    return {
+        'total_defects': dict(conn.execute(
+            "SELECT 'total', COUNT(*) FROM defects GROUP BY 'total'"
+        ).fetchall()),
+        'defects_by_type': dict(conn.execute(
+            'SELECT defect_type, COUNT(*) FROM defects GROUP BY defect_type'
+        ).fetchall()),
+        'defects_by_severity': dict(conn.execute(
+            'SELECT severity, COUNT(*) FROM defects GROUP BY severity'
+        ).fetchall()),
+        'geographic_distribution': dict(conn.execute('''
+            SELECT ROUND(latitude, 2) || ',' || ROUND(longitude, 2), COUNT(*)
+            FROM defects
+            GROUP BY ROUND(latitude, 2), ROUND(longitude, 2)
+        ''').fetchall())
+    }
+
+
+def test_incremental_analytics_match_full_recompute(batch_processor):
+    conn = batch_processor.get_db_connection()
+
+    # Rows older than two years are counted on the first run, then cleaned up
+    insert_defects(conn, [
+        (12.91, 77.51, 'pothole', 'high', 1),
+        (12.91, 77.51, 'crack', 'low', 3),
+        (12.95, 77.60, 'crack', 'medium', 10),
+        (12.80, 77.40, 'debris', 'critical', 800),
+        (12.91, 77.51, 'pothole', 'low', 900)
+    ])
+    result = batch_processor.lambda_handler({}, None)
+    assert result['statusCode'] == 200
+    assert 'cleaned_2_old_records' in json.loads(result['body'])['tasks_completed']
+    assert stored_counts(conn) == recomputed_counts(conn)
+
+    # Second run only scans the new rows and merges them into the stored counts
+    insert_defects(conn, [
+        (12.91, 77.51, 'pothole', 'high', 0),
+        (13.05, 77.70, 'water_damage', 'low', 2),
+        (12.80, 77.40, 'debris', 'medium', 750)
+    ])
+    result = batch_processor.lambda_handler({}, None)
+    assert result['statusCode'] == 200
+    assert 'cleaned_1_old_records' in json.loads(result['body'])['tasks_completed']
+    assert stored_counts(conn) == recomputed_counts(conn)
+
+    # Every metric has caught up to the last inserted id, including cleaned-up rows
+    last_ids = conn.execute('SELECT DISTINCT last_id FROM analytics_meta').fetchall()
+    assert last_ids == [(8,)]
+
+
+def test_published_analytics_match_defects(batch_processor):
+    conn = batch_processor.get_db_connection()
+    insert_defects(conn, [
+        (12.91, 77.51, 'pothole', 'high', 1),
+        (12.91, 77.51, 'crack', 'low', 20),
+        (12.80, 77.40, 'debris', 'critical', 800)
+    ])
+    batch_processor.lambda_handler({}, None)
+    insert_defects(conn, [(12.95, 77.60, 'crack', 'medium', 0)])
+    batch_processor.lambda_handler({}, None)
+
+    metrics = dict(conn.execute('''
+        SELECT metric_name, metric_value
+        FROM analytics
+        ORDER BY calculated_at, id
+    ''').fetchall())
+
+    assert int(metrics['total_defects']) == 3
+    assert json.loads(metrics['defects_by_type']) == {'pothole': 1, 'crack': 2}
+    assert int(metrics['recent_defects_7d']) == 2
+    assert json.loads(metrics['geographic_distribution']) == [
+        {'lat': 12.91, 'lng': 77.51, 'count': 2},
+        {'lat': 12.95, 'lng': 77.6, 'count': 1}
+    ]
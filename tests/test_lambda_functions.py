@@ -0,0 +1,157 @@
+"""
+Tests for the bulk upload handler
+"""
+
+import importlib.util
+import json
+import os
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'scripts')
+
+
+def load_script(name, filename):
+    """Load a script module whose file name is not importable (contains hyphens)"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def lambda_functions(tmp_path, monkeypatch):
+    """Lambda functions module bound to a fresh database in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    load_script('create_database', 'create-database.py').create_database()
+
+    module = load_script('lambda_functions', 'lambda-functions.py')
+    module.DB_PATH = str(tmp_path / 'road_metrics.db')
+    yield module
+    if module._CONN is not None:
+        module._CONN.close()
+
+
+def bulk_upload(module, records):
+    """Call the bulk upload handler and return (status code, decoded body)"""
+    result = module.lambda_handler_bulk_upload({'body': json.dumps(records)}, None)
+    return result['statusCode'], json.loads(result['body'])
+
+
+def stored_defects(conn):
+    """Inserted defects in insertion order"""
+    return conn.execute('''
+        SELECT latitude, longitude, defect_type, severity, vehicle_id
+        FROM defects
+        ORDER BY id
+    ''').fetchall()
+
+
+def stored_vehicles(conn):
+    """Vehicle totals keyed by vehicle_id"""
+    return conn.execute('''
+        SELECT vehicle_id, total_reports, last_report_timestamp
+        FROM vehicles
+        ORDER BY vehicle_id
+    ''').fetchall()
+
+
+def test_bulk_upload_inserts_only_valid_records(lambda_functions):
+    status, body = bulk_upload(lambda_functions, [
+        {'coordinates': [77.51, 12.91], 'defectType': 'pothole', 'severity': 'high'},
+        {'coordinates': [77.52, 12.92]},
+        {'coordinates': [77.53, 12.93], 'defectType': 'crack', 'severity': 'extreme'},
+        {'coordinates': [77.54, 12.94], 'defectType': 42},
+        {'coordinates': [77.55, 12.95], 'defectType': 'crack', 'timestamp': 5},
+        {'coordinates': [77.56, 12.96], 'defectType': 'debris', 'notes': ['a']},
+        {'coordinates': [77.57, 12.97], 'defectType': 'crack'}
+    ])
+
+    assert status == 200
+    assert body['insertedCount'] == 2
+    assert body['totalRecords'] == 7
+    assert body['errors'] == [
+        'Record 1: Missing required fields',
+        'Record 2: Invalid severity level',
+        'Record 3: defectType must be a string',
+        'Record 4: timestamp must be a string',
+        'Record 5: notes and vehicle_id must be strings or numbers'
+    ]
+    assert stored_defects(lambda_functions.get_db_connection()) == [
+        (12.91, 77.51, 'pothole', 'high', None),
+        (12.97, 77.57, 'crack', 'medium', None)
+    ]
+
+
+def test_bulk_upload_rejects_non_finite_coordinates(lambda_functions):
+    # json.dumps writes NaN and Infinity literals, which json.loads reads back as floats
+    status, body = bulk_upload(lambda_functions, [
+        {'coordinates': [float('nan'), 12.91], 'defectType': 'pothole'},
+        {'coordinates': [77.51, float('inf')], 'defectType': 'pothole'},
+        {'coordinates': [10 ** 400, 12.91], 'defectType': 'pothole'},
+        {'coordinates': ['77.51', 12.91], 'defectType': 'pothole'},
+        {'coordinates': [77.51, 12.91], 'defectType': 'pothole'}
+    ])
+
+    assert status == 200
+    assert body['insertedCount'] == 1
+    assert [error.split(':')[0] for error in body['errors']] == [
+        'Record 0', 'Record 1', 'Record 2', 'Record 3'
+    ]
+    assert stored_defects(lambda_functions.get_db_connection()) == [
+        (12.91, 77.51, 'pothole', 'medium', None)
+    ]
+
+
+def test_bulk_upload_accumulates_vehicle_totals(lambda_functions):
+    bulk_upload(lambda_functions, [
+        {'coordinates': [77.51, 12.91], 'defectType': 'pothole', 'vehicle_id': 'V1',
+         'timestamp': '2024-01-02T10:00:00'},
+        {'coordinates': [77.52, 12.92], 'defectType': 'crack', 'vehicle_id': 'V1',
+         'timestamp': '2024-01-01T10:00:00'},
+        {'coordinates': [77.53, 12.93], 'defectType': 'crack', 'vehicle_id': 'V2',
+         'timestamp': '2024-01-01T12:00:00'}
+    ])
+    status, body = bulk_upload(lambda_functions, [
+        {'coordinates': [77.54, 12.94], 'defectType': 'debris', 'vehicle_id': 'V1',
+         'timestamp': '2024-01-03T08:00:00'},
+        {'coordinates': [77.55, 12.95], 'defectType': 'debris', 'vehicle_id': 'V2',
+         'timestamp': '2023-12-31T08:00:00'}
+    ])
+
+    assert status == 200
+    assert body['insertedCount'] == 2
+    assert stored_vehicles(lambda_functions.get_db_connection()) == [
+        ('V1', 3, '2024-01-03T08:00:00'),
+        ('V2', 2, '2024-01-01T12:00:00')
+    ]
+
+
+def test_bulk_upload_skips_falsy_vehicle_ids(lambda_functions):
+    status, body = bulk_upload(lambda_functions, [
+        {'coordinates': [77.51, 12.91], 'defectType': 'pothole', 'vehicle_id': 0},
+        {'coordinates': [77.52, 12.92], 'defectType': 'pothole', 'vehicle_id': ''},
+        {'coordinates': [77.53, 12.93], 'defectType': 'pothole', 'vehicle_id': 7}
+    ])
+
+    assert status == 200
+    assert body['insertedCount'] == 3
+    conn = lambda_functions.get_db_connection()
+    assert [row[4] for row in stored_defects(conn)] == ['0', '', '7']
+    assert [row[:2] for row in stored_vehicles(conn)] == [('7', 1)]
+
+
+def test_bulk_upload_rolls_back_on_database_error(lambda_functions):
+    conn = lambda_functions.get_db_connection()
+    conn.execute('DROP TABLE vehicles')
+    conn.commit()
+
+    status, body = bulk_upload(lambda_functions, [
+        {'coordinates': [77.51, 12.91], 'defectType': 'pothole', 'vehicle_id': 'V1'}
+    ])
+
+    # The defect insert shares the failed transaction, so nothing is kept
+    assert status == 500
+    assert body['error'] == 'Internal server error'
+    assert stored_defects(conn) == []
+    assert not conn.in_transaction